@@ -1,6 +1,30 @@
 """main.py tkinter python clone of breakout!."""
+import asyncio
+import math
+import sys
+import time
 import tkinter as tk
 
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:  # both optional, Ball.update() falls back to Python
+    np = None
+    njit = None
+
+# Brick wall layout: every brick is BRICK_W x BRICK_H pixels, columns start
+# BRICK_X0 in from either side of the canvas and each row is (centre y, hits
+# needed to break it). The rows must be BRICK_H apart so the wall lines up
+# with Game's brick grid.
+BRICK_X0 = 5
+BRICK_W = 75
+BRICK_H = 20
+BRICK_ROWS = ((50, 2), (70, 1), (90, 1))
+assert all(lower[0] - upper[0] == BRICK_H
+           for upper, lower in zip(BRICK_ROWS, BRICK_ROWS[1:])), (
+    'BRICK_ROWS must be listed top to bottom, BRICK_H apart')
+
+
 class Game(tk.Frame):
     """Game instance, a Tkinter.Frame subclass given to Tkinter.Tk() root."""
     def __init__(self, master):
@@ -18,23 +42,40 @@ class Game(tk.Frame):
         self.canvas.pack()
         self.pack()
 
-        self.items = {}
         self.ball = None
+        # game logic runs at a fixed rate of 1 / _dt steps per second
+        self._dt = 0.02
+        # Tk events are processed every _pump_dt seconds during a game,
+        # see run()
+        self._pump_dt = 0.005
+        self._running = False
+        self._loop_task = None  # the game_loop() task, while a game is on
         self._paddle_y_start = 326
-        self.paddle = Paddle(self.canvas, self.width / 2, self._paddle_y_start)
-
-        # e.g. self.items = {'32345': Paddle, }
-        # the .item property is an int that is returned as a unique reference
-        # to element created by a canvas method (e.g. canvas.create_oval() or
-        # canvas.create_rectangle())
-        # This dict will only hold canvas items that can collide with the ball
-        self.items[self.paddle.item] = self.paddle
+        # the paddle moves on every keypress, so it is kept out of the
+        # brick grid and checked on its own in check_collisions()
+        self.paddle = Paddle(self.canvas, self.width // 2,
+                             self._paddle_y_start, self.width)
+
+        # The whole brick layout as (centre x, centre y, hits) tuples
+        columns = range(BRICK_X0, self.width - BRICK_X0, BRICK_W)  # left x
+        self._brick_specs = [(x + BRICK_W / 2, y, hits)
+                             for x in columns
+                             for y, hits in BRICK_ROWS]
+
+        # The bricks never move and sit edge to edge, so they are kept in a
+        # uniform grid with one BRICK_W x BRICK_H cell per brick, indexed
+        # _grid[row][col]. A cell goes back to None when its brick breaks.
+        self._grid_cols = len(columns)
+        self._grid_rows = len(BRICK_ROWS)
+        self._grid = [[None] * self._grid_cols
+                      for _ in range(self._grid_rows)]
+        self._grid_top = min(y for y, _ in BRICK_ROWS) - BRICK_H / 2
+        self.brick_count = 0  # unbroken bricks left
+        # lowest brick edge, a ball whose top is below it can't hit a brick
+        self._bricks_bottom = self._grid_top + self._grid_rows * BRICK_H
 
         # Create the brick layout
-        for x in range(5, self.width - 5, 75):  # 75 px step
-            self.add_brick(x + 37.5, 50, 2)
-            self.add_brick(x + 37.5, 70, 1)
-            self.add_brick(x + 37.5, 90, 1)
+        self._create_bricks(self._brick_specs)
 
         self.hud = None
 
@@ -44,15 +85,20 @@ class Game(tk.Frame):
         # bind key events to movement methods
         self.canvas.focus_set()  # set focus to canvas to make sure we hear
 
-        # We  use anonymouse function calls here as event handlers.
-        # '_' is just placeholder to mean ignore the first parameter given
-        # to us (a Tkinter event by bind()).
-        # We do it this way because the bind() call requires a callback
-        # argument, so we can't just put in self.paddle.move(10) because
-        # it is not callable (it would evaluate .move(10) in place first
-        # before calling the .bind() command!
-        self.canvas.bind('<Left>', lambda _: self.paddle.move(-10))
-        self.canvas.bind('<Right>', lambda _: self.paddle.move(10))
+        # bind() needs a callable, so we can't just put in
+        # self.paddle.move(10) (it would evaluate .move(10) in place first
+        # before calling the .bind() command!). The bound methods _left()
+        # and _right() are passed instead, without a lambda around them.
+        self.canvas.bind('<Left>', self._left)
+        self.canvas.bind('<Right>', self._right)
+
+    def _left(self, _event):
+        """Move the paddle left, bound to the Left arrow key."""
+        self.paddle.move(-10)
+
+    def _right(self, _event):
+        """Move the paddle right, bound to the Right arrow key."""
+        self.paddle.move(10)
 
     def setup_game(self):
         """Do all the necessary things to start the game."""
@@ -69,20 +115,38 @@ class Game(tk.Frame):
         paddle_coords = self.paddle.get_position()
         # set the ball on top of player's paddle at start
         x = (paddle_coords[0] + paddle_coords[2]) * 0.5
-        self.ball = Ball(self.canvas, x, 310)
+        self.ball = Ball(self.canvas, x, 310, self.width)
         self.paddle.set_ball(self.ball)  # store reference to it
 
-    def add_brick(self, x, y, hits):
+    def _create_bricks(self, specs):
         """
-        Create a Brick object.
+        Draw all the bricks at once and store them in the brick grid.
+
+        Every rectangle is created by one Tcl script run with a single
+        tk.eval() call, instead of one create_rectangle() call (and one
+        trip from Python into Tcl) per brick. The item ids it returns are
+        handed to Brick along with their coordinates, so nobody has to ask
+        the canvas for coordinates we already know.
 
-        :param x: x-axis int location to create Brick.
-        :param y: y-axis int location to create Brick.
-        :param hits: int number of hits before Brick breaks.
+        :param specs: list of (centre x, centre y, hits) tuples
         """
-        brick = Brick(self.canvas, x, y, hits)
-        # brick.item will be int that uniquely ID's that brick on canvas
-        self.items[brick.item] = brick
+        canvas = str(self.canvas)  # Tcl path name of the canvas widget
+        all_coords = [(x - BRICK_W / 2, y - BRICK_H / 2,
+                       x + BRICK_W / 2, y + BRICK_H / 2)
+                      for x, y, _ in specs]
+        # tags option is so we can reference them easy on canvas
+        commands = ['[{} create rectangle {} {} {} {} -fill {} -tags brick]'
+                    .format(canvas, *coords, Brick.COLORS[hits])
+                    for coords, (_, _, hits) in zip(all_coords, specs)]
+        # 'list [...] [...]' runs every command and returns all their ids
+        items = self.canvas.tk.splitlist(
+            self.canvas.tk.eval('list ' + ' '.join(commands)))
+        for item, coords, (_, _, hits) in zip(items, all_coords, specs):
+            row = int((coords[1] - self._grid_top) // BRICK_H)
+            col = int((coords[0] - BRICK_X0) // BRICK_W)
+            self._grid[row][col] = Brick(self.canvas, int(item), hits,
+                                         coords)
+            self.brick_count += 1
 
     def draw_text(self, x, y, text, size='40'):
         """
@@ -111,14 +175,55 @@ class Game(tk.Frame):
         self.canvas.unbind('<space>')
         self.canvas.delete(self.text)
         self.paddle.ball = None
-        self.game_loop()
+        # we are inside a Tk callback run by run(), so the asyncio loop is
+        # running and game_loop() can be scheduled on it
+        self._loop_task = asyncio.ensure_future(self.game_loop())
+        self._loop_task.add_done_callback(self._game_loop_done)
+
+    def _game_loop_done(self, task):
+        """
+        Clean up after the game_loop() task has finished.
+
+        Anything it raised is passed to report_callback_exception(), the
+        same as an exception in a Tk callback under mainloop().
+
+        :param task: the finished asyncio.Task
+        """
+        self._loop_task = None
+        if task.cancelled():  # window closed while the game was running
+            return
+        try:
+            task.result()
+        except Exception:
+            self.master.report_callback_exception(*sys.exc_info())
+
+    async def game_loop(self):
+        """
+        Main game loop, calls step() once every tick until it returns False.
+
+        Ticks are scheduled against time.monotonic() rather than just
+        sleeping _dt each time, so the time spent in step() doesn't make
+        the game drift. If we fall more than two ticks behind, the missed
+        ticks are dropped instead of being run back to back.
+        """
+        next_tick = time.monotonic()
+        while self.step():
+            next_tick += self._dt
+            delay = next_tick - time.monotonic()
+            if delay < -2 * self._dt:
+                next_tick -= delay  # too far behind, drop frames
+            await asyncio.sleep(max(0, delay))
+
+    def step(self):
+        """
+        Advance the game by one tick.
 
-    def game_loop(self):
-        """Main game loop."""
+        :rtype: bool, True while the ball is still in play
+        """
+        in_play = False
         self.check_collisions()
         # get how many Bricks left
-        num_bricks = len(self.canvas.find_withtag('brick'))
-        if num_bricks == 0:
+        if self.brick_count == 0:
             self.ball.speed = None
             self.draw_text(300, 200, "You've won!")
         elif self.ball.get_position()[3] >= self.height:
@@ -128,58 +233,163 @@ class Game(tk.Frame):
             if self.lives < 0:
                 self.draw_text(300, 200, "Game Over")
             else:
+                # after(delay in ms, callback), run by Tk from run()
                 self.after(1000, self.setup_game)
         else:
             self.ball.update()  # update position
-            # use Tkinter .after() method to call game loop again
-            # after(delay in ms, callback)
-            self.after(50, self.game_loop)
+            in_play = True
+        return in_play
+
+    async def run(self):
+        """
+        Run Tk and the game together on the asyncio event loop.
+
+        This takes the place of mainloop(), until the window is closed.
+        While a game is on, game_loop() runs as a task on the asyncio loop
+        and Tk's pending events are processed with update() every _pump_dt
+        seconds. Otherwise there is nothing else for asyncio to run, so we
+        block in Tk until its next event comes in, like mainloop() would.
+        """
+        self._running = True
+        self.master.protocol('WM_DELETE_WINDOW', self.stop)
+        while self._running:
+            if self._loop_task is None:
+                self.tk.dooneevent()  # waits for e.g. space or a timer
+                await asyncio.sleep(0)  # run game_loop() if it was started
+            else:
+                self.update()
+                await asyncio.sleep(self._pump_dt)
+        self.master.destroy()
+
+    def stop(self):
+        """Make run() return, called when the window is closed."""
+        self._running = False
 
     def check_collisions(self):
         """
         Process the ball's collisions.
 
-        Since Ball.collide receives a list of game objects and
-        canvas.find_overlapping() returns a list of colliding items
-        with a given position, we use the dict of items to transform
-        each canvas item into its corresponding game object.
+        Ball.collide receives a list of game objects. Each brick fills
+        exactly one cell of the brick grid, so the bricks the ball overlaps
+        are the ones in the few cells its bounding box covers, and we never
+        have to ask the canvas which items are under the ball. The paddle
+        is not in the grid and gets its own overlap test.
 
-        Game.items property will only contain canvas items that can
-        collide with the ball. Therefore, we only need to pass the
-        items from the Game.items dict.
+        Bricks that broke on this hit are cleared from the grid so they
+        can't be hit again, and taken off the brick_count.
 
-        We filter the canvas items that cannot collide with the ball,
-        like text objects, and then we retrieve each game objects by
-        its key.
+        Most ticks the ball is somewhere below the brick wall, where the
+        grid doesn't need to be looked at.
         """
         ball_coords = self.ball.get_position()
-        items = self.canvas.find_overlapping(*ball_coords) # list
-        # list comprehension to filter down to only objects that
-        # can collide with the ball
-        collideables = [self.items[x] for x in items if x in self.items]
+        x0, y0, x1, y1 = ball_coords
+        cells = []
+        if y0 <= self._bricks_bottom:
+            # Cells touching the ball. Touching edges count, the same as
+            # canvas.find_overlapping(), hence ceil() - 1 for the first.
+            col0 = max(math.ceil((x0 - BRICK_X0) / BRICK_W) - 1, 0)
+            col1 = min(math.floor((x1 - BRICK_X0) / BRICK_W),
+                       self._grid_cols - 1)
+            row0 = max(math.ceil((y0 - self._grid_top) / BRICK_H) - 1, 0)
+            row1 = min(math.floor((y1 - self._grid_top) / BRICK_H),
+                       self._grid_rows - 1)
+            grid = self._grid
+            cells = [(row, col) for row in range(row0, row1 + 1)
+                     for col in range(col0, col1 + 1)
+                     if grid[row][col] is not None]
+        collideables = [self._grid[row][col] for row, col in cells]
+        if overlaps(self.paddle.get_position(), ball_coords):
+            collideables.append(self.paddle)
         self.ball.collide(collideables)
+        for row, col in cells:
+            if self._grid[row][col].hits == 0:
+                self._grid[row][col] = None
+                self.brick_count -= 1
+
+
+def overlaps(a, b):
+    """
+    Check if two bounding boxes touch or overlap.
+
+    Edges that touch count as overlapping, the same as
+    Tkinter.Canvas.find_overlapping().
+
+    :param a: [x0, y0, x1, y1] bounding box
+    :param b: [x0, y0, x1, y1] bounding box
+    :rtype: bool
+    """
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def _step_ball(bbox, direction, speed, width):
+    """
+    Bounce the ball off the canvas edges and move it one tick.
+
+    Plain Python that works on lists, compiled by numba below when it is
+    installed.
+
+    :param bbox: [x0, y0, x1, y1] of the ball, moved in place
+    :param direction: [x, y] direction of the ball, flipped in place
+    :param speed: int pixels the ball moves per tick
+    :param width: int canvas width in pixels
+    :rtype: tuple of (x, y) int distance the ball moved
+    """
+    # Branchless bounce: a hit edge is True (1), and 1 - (1 << 1) is -1,
+    # which reverses that vector. A miss multiplies it by 1 instead.
+    lx = (bbox[0] <= 0) | (bbox[2] >= width)
+    ly = bbox[1] <= 0
+    direction[0] = direction[0] * (1 - (lx << 1))
+    direction[1] = direction[1] * (1 - (ly << 1))
+    x = direction[0] * speed  # scale by speed
+    y = direction[1] * speed
+    bbox[0] += x
+    bbox[1] += y
+    bbox[2] += x
+    bbox[3] += y
+    return x, y
+
+
+if njit is not None:
+    # Compiled right here at import, with an explicit signature, so the
+    # first tick of the game doesn't stall while numba compiles. Ball keeps
+    # its bbox and direction in float64 and int64 arrays for it.
+    _step_ball = njit('UniTuple(int64, 2)'
+                      '(float64[::1], int64[::1], int64, int64)',
+                      cache=True)(_step_ball)
 
 
 class GameObject():
     """Base class for game entities on a Tkinter.Canvas()."""
-    def __init__(self, canvas, item):
+    # __slots__ instead of a per-instance __dict__: faster attribute access
+    # in the per-tick code and less memory per object
+    __slots__ = ('canvas', 'item', '_bbox')
+
+    def __init__(self, canvas, item, bbox=None):
         """
         Stores the canvas and item parameters as properties of this instance
         for reference.
 
         :param canvas: a Tkinter.Canvas instance
         :param item: an entity/shape, e.g. a Canvas.create_oval reference
+        :param bbox: optional [x0, y0, x1, y1] of item, if the caller
+        already knows it. Otherwise it is read from the canvas
         """
         self.canvas = canvas
         self.item = item
+        # Only move() changes where the item is, so we keep our own copy
+        # of its bounding box instead of asking the canvas every time
+        if bbox is None:
+            bbox = canvas.coords(item)
+        self._bbox = list(bbox)
 
     def get_position(self):
         """
         Returns bounding coordinates of instance's item property.
 
-        :rtype: list of integers
+        :rtype: list of [x0, y0, x1, y1], a NumPy array for a Ball when
+        numba is installed. Don't modify it
         """
-        return self.canvas.coords(self.item)
+        return self._bbox
 
     def move(self, x, y):
         """
@@ -188,23 +398,43 @@ class GameObject():
         :param x: distance to move self.item horizontally in pixels
         :param y: distance to move self.item vertically in pixels
         """
+        bbox = self._bbox
+        bbox[0] += x
+        bbox[1] += y
+        bbox[2] += x
+        bbox[3] += y
         self.canvas.move(self.item, x, y)
 
     def delete(self):
         """Remove instance's self.item."""
         self.canvas.delete(self.item)
 
+    def on_ball_hit(self):
+        """Called by Ball.collide() when the ball hits. Does nothing here."""
+
 
 class Ball(GameObject):
     """
     Ball that bounces off solid objects on screen. Stores information
     about speed, direction, and radius of the ball.
     """
-    def __init__(self, canvas, x, y):
-        """Creates ball shape using canvas.create_oval()."""
+    __slots__ = ('radius', 'direction', 'speed', '_canvas_width')
+
+    def __init__(self, canvas, x, y, canvas_width):
+        """
+        Creates ball shape using canvas.create_oval().
+
+        :param canvas: a Tkinter.Canvas() instance
+        :param x: the horizontal axis location (int)
+        :param y: the vertical axis location (int)
+        :param canvas_width: width of the canvas in pixels, the ball
+        bounces off either side of it
+        """
         self.radius = 10
+        # the canvas never changes size, so don't ask Tk every frame
+        self._canvas_width = canvas_width
         self.direction = [1, -1]  # right and up
-        self.speed = 10
+        self.speed = 4  # pixels per tick, 200 px/s at 50 ticks/s
 
         # self.item value will be an integer, which is ref num returned by method
         item = canvas.create_oval(x - self.radius, y - self.radius,
@@ -213,22 +443,23 @@ class Ball(GameObject):
         # now call parent constructor with our required item
         GameObject.__init__(self, canvas, item)
 
+        if njit is not None:
+            # the compiled _step_ball() takes arrays, made once here and
+            # updated in place from then on
+            self._bbox = np.array(self._bbox, dtype=np.float64)
+            self.direction = np.array(self.direction, dtype=np.int64)
+
     def update(self):
         """Logic for changing Ball direction based on collisions."""
 
         # ---------------------------------------------------------
         # BOUNDS COLLISIONS
         # ---------------------------------------------------------
-        ball_coords = self.get_position()
-        width = self.canvas.winfo_width()
-
-        if ball_coords[0] <= 0 or ball_coords[2] >= width:
-            self.direction[0] *= -1  # reverse x vector
-        if ball_coords[1] <= 0:
-            self.direction[1] *= -1  # reverse y vector
-        x = self.direction[0] * self.speed  # scale by Ball's speed
-        y = self.direction[1] * self.speed
-        self.move(x, y)  # inherited method
+        # _step_ball() bounces the ball and moves self._bbox, only the
+        # canvas move is left here
+        x, y = _step_ball(self._bbox, self.direction, self.speed,
+                          self._canvas_width)
+        self.canvas.move(self.item, x, y)
 
 
     def collide(self, game_objects):
@@ -284,8 +515,7 @@ class Ball(GameObject):
                 self.direction[1] *= -1
         # Do below regardless of how many collisions came in
         for game_object in game_objects:
-            if isinstance(game_object, Brick):
-                game_object.hit()  # decrement hit counter, etc. in Brick class
+            game_object.on_ball_hit()  # e.g. Brick decrements hit counter
 
 
 class Paddle(GameObject):
@@ -293,23 +523,31 @@ class Paddle(GameObject):
     The player's paddle. A set_ball method stores a reference to the ball,
     which can be moved with the ball before the game starts.
     """
-    def __init__(self, canvas, x, y):
+    __slots__ = ('width', 'height', 'ball', '_min_x', '_max_x')
+
+    def __init__(self, canvas, x, y, canvas_width):
         """
         Create a Paddle instance using canvas.create_rectangle().
 
         :param canvas: a Tkinter.Canvas() instance
         :param x: the horizontal axis location (int)
         :param y: the vertical axis location (int)
+        :param canvas_width: width of the canvas in pixels, the paddle
+        can't move past either side of it
         """
         self.width = 80
         self.height = 10
         self.ball = None
+        # the left edge has to stay between these so the whole paddle is
+        # on the canvas
+        self._min_x = 0
+        self._max_x = canvas_width - self.width
 
         # item will be int ref num returned by create_rectangle()
-        item = canvas.create_rectangle(x - self.width / 2,
-                                       y - self.height / 2,
-                                       x + self.width / 2,
-                                       y + self.height / 2,
+        item = canvas.create_rectangle(x - self.width // 2,
+                                       y - self.height // 2,
+                                       x + self.width // 2,
+                                       y + self.height // 2,
                                        fill='blue')
         # call parent class now with our require item argument
         GameObject.__init__(self, canvas, item)
@@ -327,44 +565,37 @@ class Paddle(GameObject):
 
         :param offset: integer. amount to move in pixels left or right.
         """
-        coords = self.get_position()  # e.g., [int, int, int, int]
-        width = self.canvas.winfo_width()
+        new_left = self._bbox[0] + offset
         # bounds check
-        if coords[0] + offset >= 0 and coords[2] + offset <= width:
-            GameObject.move(self, offset, 0)  # 0 is y-axis
-            # Below happens when the game has not been started; move the ball
-            if self.ball is not None:
-                self.ball.move(offset, 0)  # Call Ball inherited move() method
+        if new_left < self._min_x or new_left > self._max_x:
+            return
+        GameObject.move(self, offset, 0)  # 0 is y-axis
+        # Below happens when the game has not been started; move the ball
+        if self.ball is not None:
+            self.ball.move(offset, 0)  # Call Ball inherited move() method
 
 
 class Brick(GameObject):
     """Ball objects destroy these canvas rectangle built objects when hit."""
     COLORS = {1: '#999999', 2: '#555555', 3: '#222222'}
+    __slots__ = ('hits',)
 
-    def __init__(self, canvas, x, y, hits):
+    def __init__(self, canvas, item, hits, bbox):
         """
-        Initialize a Brick object.
+        Initialize a Brick object around an already drawn rectangle.
+
+        See Game._create_bricks() for where the rectangle comes from.
 
         :param canvas: a Tkinter.Canvas() instance
-        :param x: Where to place it on horizontal x axis
-        :param y: Where to place it on the vertical x axis
+        :param item: the canvas rectangle item of this Brick
         :param hits: number of hits Brick can take before 'breaking'
+        :param bbox: [x0, y0, x1, y1] the rectangle was drawn at
         """
-        self.width = 75
-        self.height = 20
-        self.hits = hits
-        color = Brick.COLORS[hits]  # hits arg must be int 1,2, or 3
-
-        # tags keyword is so we can reference it easy on canvas
-        item = canvas.create_rectangle(x - self.width / 2,
-                                       y - self.height / 2,
-                                       x + self.width / 2,
-                                       y + self.height / 2,
-                                       fill=color, tags='brick')
-        # now call parent class with our require item
-        GameObject.__init__(self, canvas, item)
+        # pass bbox on so GameObject doesn't ask the canvas for it
+        GameObject.__init__(self, canvas, item, bbox)
+        self.hits = hits  # hits must be int 1,2, or 3, see COLORS
 
-    def hit(self):
+    def on_ball_hit(self):
         """Decrement hits counter. Delete instance if at 0."""
         self.hits -= 1
         if self.hits == 0:
@@ -380,4 +611,4 @@ if __name__ == "__main__":
     ROOT.title('Tkinter Breakout')
     # Frame() needs a Tk() instance as its parent, we pass our root app
     GAME = Game(ROOT)
-    GAME.mainloop()
+    asyncio.run(GAME.run())